@@ -7,28 +7,81 @@ and produces a structured Markdown comment.
 """
 
 import csv
+import functools
 import io
 import json
+import operator
 import os
 import re
 import sys
-from datetime import datetime
+from collections import defaultdict
+from datetime import date, datetime
 
 NO_RESPONSE = "_No response_"
+MISSING_DEFINITION = "Definition not provided in Code Pack."
+INACTIVE_NOTE = "Code is inactive or not effective for the date of service."
+DUP_NOTE = "This appears duplicated under the project's duplicate rule. Please confirm with billing."
+
+_MONEY_TRANS = str.maketrans("", "", "$,")
+
+# Heading lines are captured whole and stripped in Python: a lazy heading
+# followed by optional whitespace backtracks quadratically on long runs of spaces.
+_SECTION_RE = re.compile(r"^###([^\n]*)(?:\n|\Z)(.*?)(?=\n###\s|\Z)", re.DOTALL | re.MULTILINE)
+_FENCE_OPEN_RE = re.compile(r"^```[^\n]*\n?")
+_FENCE_CLOSE_RE = re.compile(r"\n?```\s*$")
+
+# Newline-terminated row template for the SECTION 2 table, filled from a section2 entry dict
+SECTION2_ROW = (
+    "| {line_id} | {dos} | {code} | {code_type} "
+    "| {official_desc} | {plain_eng} | {units} | {charge_str} |\n"
+)
 
 
 def blank(val):
     """Return True if val is empty, None, or the GitHub 'no response' sentinel."""
     if val is None:
         return True
-    s = str(val).strip()
-    return s == "" or s == NO_RESPONSE
+    if not isinstance(val, str):
+        val = str(val)
+    if not val:
+        return True
+    s = val.strip()
+    return not s or s == NO_RESPONSE
 
 
 def parse_money(val):
     """Parse a monetary string like '$1,200.00' or '1200' into a float."""
-    s = str(val).strip().replace("$", "").replace(",", "")
-    return float(s)
+    return float(val.translate(_MONEY_TRANS))
+
+
+def parse_iso_date(val):
+    """
+    Parse a YYYY-MM-DD string into a date.
+    Canonical 10-character dates are sliced directly; anything else falls
+    back to strptime so accepted inputs and errors stay the same.
+    """
+    if len(val) == 10 and val[4] == "-" and val[7] == "-" and val.isascii():
+        y, m, d = val[:4], val[5:7], val[8:]
+        if y.isdigit() and m.isdigit() and d.isdigit():
+            return date(int(y), int(m), int(d))
+    return datetime.strptime(val, "%Y-%m-%d").date()
+
+
+_dos_cache = {}
+
+
+def parse_dos(val):
+    """Parse a YYYY-MM-DD string into a date, memoized since dates repeat across rows."""
+    d = _dos_cache.get(val)
+    if d is None:
+        d = parse_iso_date(val)
+        _dos_cache[val] = d
+    return d
+
+
+def csv_rows(f, delimiter=","):
+    """Iterate csv.reader rows from f, skipping blank lines as csv.DictReader does."""
+    return filter(None, csv.reader(f, delimiter=delimiter))
 
 
 def fmt_money(val):
@@ -40,43 +93,65 @@ def fmt_money(val):
 # 1. Load code definitions
 # ---------------------------------------------------------------------------
 def load_code_definitions(path):
-    """Load code_definitions_pack_BIG.csv into a dict keyed by code."""
+    """
+    Load code_definitions_pack_BIG.csv into a dict keyed by code.
+    Each value is a tuple of
+    (code_type, official_description, plain_english, is_active, effective_date),
+    where effective_date is None if the pack's date could not be parsed.
+    """
     defs = {}
     with open(path, newline="", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
+        reader = csv_rows(f)
+        header = next(reader)
+        idx = {name.strip(): i for i, name in enumerate(header)}
+        c, ct, od, pe, st, ed = (
+            idx[k]
+            for k in ("code", "code_type", "official_description", "plain_english", "status", "effective_date")
+        )
         for row in reader:
-            code = row["code"].strip()
-            defs[code] = {
-                "code_type": row["code_type"].strip(),
-                "official_description": row["official_description"].strip(),
-                "plain_english": row["plain_english"].strip(),
-                "status": row["status"].strip(),
-                "effective_date": row["effective_date"].strip(),
-            }
+            # Parse effective_date once here rather than per line item. A bad
+            # date must not fail bills that never use the code, so keep loading.
+            try:
+                eff_date = parse_iso_date(row[ed].strip())
+            except ValueError:
+                eff_date = None
+            defs[row[c].strip()] = (
+                row[ct].strip(),
+                row[od].strip(),
+                row[pe].strip(),
+                row[st].strip() == "Active",
+                eff_date,
+            )
     return defs
 
 
 # ---------------------------------------------------------------------------
 # 2. Parse issue body
 # ---------------------------------------------------------------------------
-def extract_section(body, heading):
+def parse_all_sections(body):
     """
-    Extract the content under a ### heading from the issue body.
-    Returns the text between this heading and the next ### heading (or end).
+    Split the issue body into its ### sections in a single pass.
+    Returns a dict mapping each heading to the text between it and the
+    next ### heading (or end). The first occurrence of a heading wins.
     """
-    pattern = rf"###\s*{re.escape(heading)}\s*\n(.*?)(?=\n###\s|\Z)"
-    m = re.search(pattern, body, re.DOTALL)
-    if m:
-        return m.group(1).strip()
-    return None
+    sections = {}
+    for m in _SECTION_RE.finditer(body):
+        sections.setdefault(m.group(1).strip(), m.group(2).strip())
+    return sections
 
 
 def detect_delimiter(text):
-    """Detect whether the pasted data is TSV or CSV."""
-    lines = [l for l in text.strip().splitlines() if l.strip()]
-    if not lines:
-        return ","
-    header = lines[0]
+    """Detect whether the pasted data is TSV or CSV from its header line."""
+    # Only the first non-blank line matters, so scan for it by index
+    start = 0
+    while True:
+        nl = text.find("\n", start)
+        header = text[start:] if nl < 0 else text[start:nl]
+        if header.strip():
+            break
+        if nl < 0:
+            return ","
+        start = nl + 1
     tab_count = header.count("\t")
     comma_count = header.count(",")
     return "\t" if tab_count >= comma_count and tab_count > 0 else ","
@@ -91,26 +166,41 @@ def parse_line_items(text):
         return [], ["No line-item data provided."]
 
     # GitHub Issue Forms with render:text wrap content in code fences — strip them
-    text = re.sub(r"^```[^\n]*\n?", "", text.strip())
-    text = re.sub(r"\n?```\s*$", "", text.strip())
+    text = _FENCE_OPEN_RE.sub("", text.strip())
+    text = _FENCE_CLOSE_RE.sub("", text.strip())
 
     delimiter = detect_delimiter(text)
     rows = []
     errors = []
-    reader = csv.DictReader(io.StringIO(text.strip()), delimiter=delimiter)
+    reader = csv_rows(io.StringIO(text.strip()), delimiter=delimiter)
 
     # Normalize header names
-    if reader.fieldnames:
-        reader.fieldnames = [f.strip().lower() for f in reader.fieldnames]
+    header = next(reader, None)
+    if not header:
+        return [], ["No line-item data provided."]
+    col_idx = {name.strip().lower(): i for i, name in enumerate(header)}
 
     required_cols = {"line_id", "date_of_service", "code", "code_type", "units", "charge"}
-    if reader.fieldnames and not required_cols.issubset(set(reader.fieldnames)):
-        missing = required_cols - set(reader.fieldnames)
+    if not required_cols.issubset(col_idx):
+        missing = required_cols - col_idx.keys()
         return [], [f"Missing required columns: {', '.join(sorted(missing))}"]
 
+    li_idx = col_idx["line_id"]
+    dos_idx = col_idx["date_of_service"]
+    code_idx = col_idx["code"]
+    ct_idx = col_idx["code_type"]
+    units_idx = col_idx["units"]
+    charge_idx = col_idx["charge"]
+    label_idx = col_idx.get("bill_label")
+    ncols = len(header)
+
     for i, raw_row in enumerate(reader, start=2):  # row 1 is header
+        # Pad short rows so every known column can be indexed
+        if len(raw_row) < ncols:
+            raw_row += [""] * (ncols - len(raw_row))
+
         row_errors = []
-        line_id = (raw_row.get("line_id") or "").strip()
+        line_id = raw_row[li_idx].strip()
 
         # Validate line_id
         try:
@@ -120,25 +210,25 @@ def parse_line_items(text):
             lid = None
 
         # Validate date_of_service
-        dos_str = (raw_row.get("date_of_service") or "").strip()
+        dos_str = raw_row[dos_idx].strip()
         try:
-            dos = datetime.strptime(dos_str, "%Y-%m-%d").date()
+            dos = parse_dos(dos_str)
         except ValueError:
             row_errors.append(f"invalid date_of_service '{dos_str}'")
             dos = None
 
         # Validate code
-        code = (raw_row.get("code") or "").strip()
+        code = raw_row[code_idx].strip()
         if not code:
             row_errors.append("missing code")
 
         # Validate code_type
-        code_type = (raw_row.get("code_type") or "").strip()
+        code_type = raw_row[ct_idx].strip()
         if not code_type:
             row_errors.append("missing code_type")
 
         # Validate units
-        units_str = (raw_row.get("units") or "").strip()
+        units_str = raw_row[units_idx].strip()
         try:
             units = int(units_str)
         except (ValueError, TypeError):
@@ -146,14 +236,14 @@ def parse_line_items(text):
             units = None
 
         # Validate charge
-        charge_str = (raw_row.get("charge") or "").strip()
+        charge_str = raw_row[charge_idx].strip()
         try:
             charge = parse_money(charge_str)
         except (ValueError, TypeError):
             row_errors.append(f"invalid charge '{charge_str}'")
             charge = None
 
-        bill_label = (raw_row.get("bill_label") or "").strip()
+        bill_label = raw_row[label_idx].strip() if label_idx is not None else ""
 
         if row_errors:
             lid_display = line_id if line_id else f"(row {i})"
@@ -169,21 +259,60 @@ def parse_line_items(text):
                 "bill_label": bill_label,
             })
 
+    if not rows and not errors:
+        errors.append("No line items found below the header row.")
+
     return rows, errors
 
 
 # ---------------------------------------------------------------------------
 # 3. Apply rules
 # ---------------------------------------------------------------------------
+def resolve_definition(code_defs, code, code_type, dos):
+    """
+    Apply the code-definition rules (3-6) to one (code, code_type, dos).
+    Returns (official_desc, plain_eng, notes, clarification_reasons), with
+    the reasons as a tuple so the result can be cached and shared.
+    """
+    if code not in code_defs:
+        # Rule 3: missing code
+        return MISSING_DEFINITION, MISSING_DEFINITION, "", ("Missing code definition",)
+
+    defn_type, defn_official, defn_plain, is_active, eff_date = code_defs[code]
+    # Rule 6: code_type mismatch
+    if code_type != defn_type:
+        return (
+            MISSING_DEFINITION,
+            MISSING_DEFINITION,
+            "",
+            (f"code_type mismatch: bill has '{code_type}', pack has '{defn_type}'",),
+        )
+
+    # Rule 4 & 5: status and effective_date (an unparseable date is never effective)
+    if not is_active or eff_date is None or eff_date > dos:
+        return "N/A", "N/A", INACTIVE_NOTE, (INACTIVE_NOTE,)
+
+    return defn_official, defn_plain, "", ()
+
+
 def evaluate_line_items(rows, code_defs):
     """
     Evaluate each line item against rules.
-    Returns (section2, duplicates, clarifications).
+    Returns (section2, duplicates, clarifications, totals), where totals holds
+    the charge sum and date-of-service range accumulated during the pass.
     """
     section2 = []
     clarifications = []
+    # Duplicate groups keyed by (date_of_service, code, units, charge)
+    dup_groups_map = defaultdict(list)
+    total_charge = 0
+    min_dos = max_dos = None
+
+    # Rules 3-6 depend only on (code, code_type, dos), which repeat heavily
+    resolve = functools.lru_cache(maxsize=None)(functools.partial(resolve_definition, code_defs))
 
-    for item in sorted(rows, key=lambda x: x["line_id"]):
+    rows = sorted(rows, key=operator.itemgetter("line_id"))
+    for item in rows:
         code = item["code"]
         code_type = item["code_type"]
         dos = item["date_of_service"]
@@ -191,40 +320,9 @@ def evaluate_line_items(rows, code_defs):
         charge = item["charge"]
         line_id = item["line_id"]
 
-        notes = []
-        official_desc = ""
-        plain_eng = ""
-        needs_clarification = False
-        clarification_reasons = []
-
-        if code not in code_defs:
-            # Rule 3: missing code
-            official_desc = "Definition not provided in Code Pack."
-            plain_eng = "Definition not provided in Code Pack."
-            needs_clarification = True
-            clarification_reasons.append("Missing code definition")
-        else:
-            defn = code_defs[code]
-            # Rule 6: code_type mismatch
-            if code_type != defn["code_type"]:
-                official_desc = "Definition not provided in Code Pack."
-                plain_eng = "Definition not provided in Code Pack."
-                needs_clarification = True
-                clarification_reasons.append(
-                    f"code_type mismatch: bill has '{code_type}', pack has '{defn['code_type']}'"
-                )
-            else:
-                # Rule 4 & 5: status and effective_date
-                eff_date = datetime.strptime(defn["effective_date"], "%Y-%m-%d").date()
-                if defn["status"] != "Active" or eff_date > dos:
-                    official_desc = "N/A"
-                    plain_eng = "N/A"
-                    notes.append("Code is inactive or not effective for the date of service.")
-                    needs_clarification = True
-                    clarification_reasons.append("Code is inactive or not effective for the date of service.")
-                else:
-                    official_desc = defn["official_description"]
-                    plain_eng = defn["plain_english"]
+        official_desc, plain_eng, notes, def_reasons = resolve(code, code_type, dos)
+        clarification_reasons = list(def_reasons)
+        needs_clarification = bool(clarification_reasons)
 
         # Clarification trigger: units = 0 AND charge > 0
         if units == 0 and charge > 0:
@@ -245,9 +343,17 @@ def evaluate_line_items(rows, code_defs):
             "plain_eng": plain_eng,
             "units": units,
             "charge": charge,
-            "notes": "; ".join(notes) if notes else "",
+            "charge_str": fmt_money(charge),
+            "notes": notes,
         }
         section2.append(entry)
+        total_charge += charge
+        dos_str = entry["dos"]
+        if min_dos is None or dos_str < min_dos:
+            min_dos = dos_str
+        if max_dos is None or dos_str > max_dos:
+            max_dos = dos_str
+        dup_groups_map[(entry["dos"], code, units, charge)].append(entry)
 
         if needs_clarification:
             clarifications.append({
@@ -257,134 +363,120 @@ def evaluate_line_items(rows, code_defs):
             })
 
     # --- Duplicate detection (Rule 7-10) ---
-    # Group by (date_of_service, code, units, charge)
-    from collections import defaultdict
-    dup_groups_map = defaultdict(list)
-    for item in sorted(rows, key=lambda x: x["line_id"]):
-        key = (
-            item["date_of_service"].strftime("%Y-%m-%d"),
-            item["code"],
-            item["units"],
-            item["charge"],
-        )
-        dup_groups_map[key].append(item["line_id"])
-
-    # Only keep groups with more than one member
+    # Only keep groups with more than one member. Rows are already sorted by
+    # line_id, so groups are in order of their lowest line_id.
     dup_groups = []
-    dup_line_ids = set()
     group_num = 1
-    for key in sorted(dup_groups_map.keys(), key=lambda k: min(dup_groups_map[k])):
-        ids = dup_groups_map[key]
-        if len(ids) > 1:
+    for key, entries in dup_groups_map.items():
+        if len(entries) > 1:
             dup_groups.append({
                 "group": group_num,
-                "line_ids": ids,
+                "line_ids": [e["line_id"] for e in entries],
                 "dos": key[0],
                 "code": key[1],
                 "units": key[2],
                 "charge": key[3],
+                "charge_str": entries[0]["charge_str"],
             })
-            for lid in ids:
-                dup_line_ids.add(lid)
             group_num += 1
 
-    # Add duplicate notes to section2
-    for entry in section2:
-        if entry["line_id"] in dup_line_ids:
-            dup_note = "This appears duplicated under the project's duplicate rule. Please confirm with billing."
-            if entry["notes"]:
-                entry["notes"] += "; " + dup_note
-            else:
-                entry["notes"] = dup_note
+            # Add duplicate notes to the group's section2 entries
+            for entry in entries:
+                if entry["notes"]:
+                    entry["notes"] = "; ".join((entry["notes"], DUP_NOTE))
+                else:
+                    entry["notes"] = DUP_NOTE
 
-    return section2, dup_groups, clarifications
+    totals = {
+        "total_charge": total_charge,
+        "min_dos": min_dos,
+        "max_dos": max_dos,
+        "multi_dos": min_dos != max_dos,
+    }
+    return section2, dup_groups, clarifications, totals
 
 
 # ---------------------------------------------------------------------------
 # 4. Format output
 # ---------------------------------------------------------------------------
-def format_output(header_info, section2, dup_groups, clarifications, input_errors):
-    """Format the final Markdown comment."""
-    lines = []
-
+def format_output_lines(header_info, section2, dup_groups, clarifications, totals, input_errors):
+    """
+    Format the final Markdown comment.
+    Yields newline-terminated lines so the caller can stream them to a file.
+    """
     # --- Input Problems (if any) ---
     if input_errors:
-        lines.append("Input Problems")
-        lines.append("")
-        lines.append("The following rows could not be parsed and are excluded from the output below:")
-        lines.append("")
+        yield "Input Problems\n"
+        yield "\n"
+        yield "The following rows could not be parsed and are excluded from the output below:\n"
+        yield "\n"
         for err in input_errors:
-            lines.append(f"- {err}")
-        lines.append("")
-        lines.append("⚠️ The output below is INCOMPLETE because of the skipped rows listed above.")
-        lines.append("")
-        lines.append("---")
-        lines.append("")
+            yield f"- {err}\n"
+        yield "\n"
+        yield "⚠️ The output below is INCOMPLETE because of the skipped rows listed above.\n"
+        yield "\n"
+        yield "---\n"
+        yield "\n"
 
     # --- SECTION 1 ---
-    lines.append("SECTION 1: Bill Header Summary")
-    lines.append("")
+    yield "SECTION 1: Bill Header Summary\n"
+    yield "\n"
     for key, val in header_info.items():
-        lines.append(f"- **{key}:** {val}")
-    lines.append("")
-
-       # --- SECTION 2 ---
-    lines.append("SECTION 2: Plain-English Line Item Table")
-    lines.append("")
-    lines.append("| Line # | DOS | Code | Code Type | Official Description | Plain-English | Units | Charge |")
-    lines.append("|---|---|---|---|---|---|---|---|")
-    for e in section2:
-        charge_str = fmt_money(e["charge"])
-        lines.append(
-            f"| {e['line_id']} | {e['dos']} | {e['code']} | {e['code_type']} "
-            f"| {e['official_desc']} | {e['plain_eng']} | {e['units']} | {charge_str} |"
-        )
-    lines.append("")
+        yield f"- **{key}:** {val}\n"
+    yield "\n"
+
+    # --- SECTION 2 ---
+    yield "SECTION 2: Plain-English Line Item Table\n"
+    yield "\n"
+    yield "| Line # | DOS | Code | Code Type | Official Description | Plain-English | Units | Charge |\n"
+    yield "|---|---|---|---|---|---|---|---|\n"
+    yield from (SECTION2_ROW.format_map(e) for e in section2)
+    yield "\n"
 
     # --- SECTION 3 ---
-    lines.append("SECTION 3: Duplicates Table")
-    lines.append("")
+    yield "SECTION 3: Duplicates Table\n"
+    yield "\n"
     if not dup_groups:
-        lines.append("No duplicates found under the project's duplicate rule.")
+        yield "No duplicates found under the project's duplicate rule.\n"
     else:
-        lines.append("| Duplicate Group | Line #s | Matching Fields | Suggested question for billing |")
-        lines.append("|---|---|---|---|")
+        yield "| Duplicate Group | Line #s | Matching Fields | Suggested question for billing |\n"
+        yield "|---|---|---|---|\n"
         for g in dup_groups:
             ids_str = ", ".join(str(lid) for lid in g["line_ids"])
-            matching = f"DOS={g['dos']}, Code={g['code']}, Units={g['units']}, Charge={fmt_money(g['charge'])}"
-            question = "This appears duplicated under the project's duplicate rule. Please confirm with billing."
-            lines.append(f"| {g['group']} | {ids_str} | {matching} | {question} |")
-    lines.append("")
+            matching = f"DOS={g['dos']}, Code={g['code']}, Units={g['units']}, Charge={g['charge_str']}"
+            yield f"| {g['group']} | {ids_str} | {matching} | {DUP_NOTE} |\n"
+    yield "\n"
 
     # --- SECTION 4 ---
-    lines.append("SECTION 4: Needs Clarification List")
-    lines.append("")
+    yield "SECTION 4: Needs Clarification List\n"
+    yield "\n"
     if not clarifications:
-        lines.append("No items require clarification.")
+        yield "No items require clarification.\n"
     else:
         for c in clarifications:
             for reason in c["reasons"]:
-                lines.append(f"- Clarify: Line {c['line_id']} (Code {c['code']}): {reason}")
-    lines.append("")
+                yield f"- Clarify: Line {c['line_id']} (Code {c['code']}): {reason}\n"
+    yield "\n"
 
     # --- SECTION 5 ---
-    total_charge = sum(e["charge"] for e in section2)
     num_items = len(section2)
     num_dups = sum(len(g["line_ids"]) for g in dup_groups)
     num_clar = len(clarifications)
 
-    dos_set = sorted(set(e["dos"] for e in section2))
-    dos_range = f"{dos_set[0]} to {dos_set[-1]}" if len(dos_set) > 1 else dos_set[0]
+    if totals["multi_dos"]:
+        dos_range = f"{totals['min_dos']} to {totals['max_dos']}"
+    else:
+        dos_range = totals["min_dos"]
 
-    lines.append("SECTION 5: Patient-Friendly Summary Paragraph")
-    lines.append("")
+    yield "SECTION 5: Patient-Friendly Summary Paragraph\n"
+    yield "\n"
 
     summary_parts = []
     summary_parts.append(
         f"This bill contains {num_items} line items spanning dates of service from {dos_range}."
     )
     summary_parts.append(
-        f"The total billed amount across all line items is {fmt_money(total_charge)}."
+        f"The total billed amount across all line items is {fmt_money(totals['total_charge'])}."
     )
     summary_parts.append(
         "Services include procedures, facility fees, medications, and modifiers."
@@ -411,10 +503,7 @@ def format_output(header_info, section2, dup_groups, clarifications, input_error
         "Please review each section and contact your billing department with any questions."
     )
 
-    lines.append(" ".join(summary_parts))
-    lines.append("")
-
-    return "\n".join(lines)
+    yield " ".join(summary_parts) + "\n"
 
 
 # ---------------------------------------------------------------------------
@@ -439,24 +528,25 @@ def main():
         sys.exit(1)
 
     # --- Parse header fields ---
-    provider_name = extract_section(issue_body, "Provider Name") or ""
+    sections = parse_all_sections(issue_body)
+    provider_name = sections.get("Provider Name", "")
     if blank(provider_name):
         provider_name = ""
-    facility_name = extract_section(issue_body, "Facility Name") or ""
+    facility_name = sections.get("Facility Name", "")
     if blank(facility_name):
         facility_name = ""
-    bill_date = extract_section(issue_body, "Bill Date") or ""
+    bill_date = sections.get("Bill Date", "")
     if blank(bill_date):
         bill_date = ""
-    patient_account = extract_section(issue_body, "Patient Account Number") or ""
+    patient_account = sections.get("Patient Account Number", "")
     if blank(patient_account):
         patient_account = ""
-    total_billed_raw = extract_section(issue_body, "Total Billed") or ""
+    total_billed_raw = sections.get("Total Billed", "")
     if blank(total_billed_raw):
         total_billed_raw = ""
 
     # --- Parse line items ---
-    line_items_text = extract_section(issue_body, "Line Items")
+    line_items_text = sections.get("Line Items")
     rows, parse_errors = parse_line_items(line_items_text)
 
     if not rows and parse_errors:
@@ -467,11 +557,9 @@ def main():
         sys.exit(1)
 
     # --- Evaluate ---
-    section2, dup_groups, clarifications = evaluate_line_items(rows, code_defs)
+    section2, dup_groups, clarifications, totals = evaluate_line_items(rows, code_defs)
 
     # --- Build header info ---
-    computed_total = sum(e["charge"] for e in section2)
-
     header_info = {}
     if provider_name:
         header_info["Provider Name"] = provider_name
@@ -484,13 +572,17 @@ def main():
 
     if total_billed_raw:
         header_info["Total Billed (Provided)"] = total_billed_raw
-    header_info["Total Billed (Computed)"] = fmt_money(computed_total)
+    header_info["Total Billed (Computed)"] = fmt_money(totals["total_charge"])
 
     # --- Format output ---
-    comment = format_output(header_info, section2, dup_groups, clarifications, parse_errors)
-
-    with open(output_file, "w") as f:
-        f.write(comment)
+    # Stream lines to a temp file rather than joining one large string, and only
+    # move it into place once complete so a failure never leaves a partial comment
+    tmp_file = output_file + ".tmp"
+    with open(tmp_file, "w", buffering=1 << 16) as f:
+        f.writelines(
+            format_output_lines(header_info, section2, dup_groups, clarifications, totals, parse_errors)
+        )
+    os.replace(tmp_file, output_file)
 
     print(f"Output written to {output_file}")
 